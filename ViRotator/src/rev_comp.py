@@ -2,129 +2,109 @@
 
 
 import argparse
+from functools import partial
+from viro_io import iter_fasta, iter_fastq, iter_batches, map_batches, write_fasta, write_fastq
 
 """
 USAGE
-    ./rev_comp.py [-h] -f <input_file> -t <file_type> -b <blast_file> -o <output_file> -l <output_log>
+    ./rev_comp.py [-h] -f <input_file> -t <file_type> -b <blast_file> -o <output_file> -l <output_log> [-p <threads>]
 DESCRIPTION
     Script to reverse complement sequences on minus strand. fasta and fastq file are accepted.
+    Records are streamed, so a duplicated id is written, reverse complemented and logged once per occurrence, in input order.
 PREREQUISITE
     - python3
+    - viro_io.py
     - A blast output file formated like 'qseqid sstrand'
 """
 
 
-def parse_fasta(input_file):
-    """
-    Parse input FASTA file and keep it into a dict like : {seqId : {"seq" : }}
-    """
-    fastaDict = dict()
-    seqId = None
-    for line in input_file:
-        if line.startswith(">"):
-            seqId = line.strip().replace(">","").split()[0]
-            fastaDict[seqId] = {}
-            fastaDict[seqId]["seq"] = ""
-        else:
-            fastaDict[seqId]["seq"] += line.strip()
-    return fastaDict
-
-
-def parse_fastq(input_file):
-    """
-    Parse input FASTQ file and keep it into a dict like : {seqId : {"seq" : , "qual" : }}
-    """
-    fastqDict = dict()
-    seqId = None
-    for line in input_file:
-        if line.startswith("@") and "~" not in line: # Rq : some quality lines start with @
-            seqId = line.strip().replace("@","").split()[0]
-            complementary_lines = []
-            fastqDict[seqId] = {}
-            fastqDict[seqId]["seq"] = ""
-            fastqDict[seqId]["qual"] = ""
-        else:
-            complementary_lines.append(line.strip())
-            if len(complementary_lines)==3:
-                fastqDict[seqId]["seq"] += complementary_lines[0] 
-                fastqDict[seqId]["qual"] += complementary_lines[2]
-    return fastqDict
+# Translation table used to complement sequences, built once at module load
+_COMP_TABLE = bytes.maketrans(b'ACGTacgtNn', b'TGCAtgcaNn')
 
 
 def parse_blast_file(blast_file):
     """
-    Parse input blast file and keep it into a dict like : {seqId : {"strand" : }}
+    Parse input blast file and keep it into a dict like : {seqId : isMinus} where isMinus is True if the sequence is on the minus strand
     """
     blastDict = dict()
     for line in blast_file:
-        line = line.strip().split("\t")
+        line = line.strip().split(b"\t")
         seqId = line[0]
         strand = line[1]
-        blastDict[seqId] = dict()
-        blastDict[seqId]["strand"] = strand
+        blastDict[seqId] = strand == b"minus"
     return blastDict
 
 
-def reverse_complement(fileDict, blastDict, file_type):
+def select_strand(batches, blastDict, idSeqRevComp, idNotBlast):
     """
-    Reverse complement sequences into fileDict if they're on the minus strand, info into blastDict. 
-    Keep all id of sequences reverse complemented into a list idSeqRevComp.
+    Keep into each batch the sequences where strand was find, info into blastDict, and yield them with the list of indexes 
+    of the sequences on the minus strand like : (ids, seqs, quals, minus), as expected by map_batches. Keep all id of sequences on the minus strand into the list 
+    idSeqRevComp and all id of sequences where strand was not find into the list idNotBlast.
     """
-    idSeqRevComp = list()
-    idNotBlast = list()
-    for seqId in fileDict:
-        if seqId in blastDict:
-            if blastDict[seqId]["strand"] == "minus":
+    for ids, seqs, quals in batches:
+        keptIds, keptSeqs, keptQuals, minus = list(), list(), list(), list()
+        for seqId, seq, qual in zip(ids, seqs, quals):
+            isMinus = blastDict.get(seqId)
+            if isMinus is None:
+                idNotBlast.append(seqId)
+                continue
+            if isMinus:
                 idSeqRevComp.append(seqId)
-                # Complement
-                comp = fileDict[seqId]["seq"].maketrans('ATGC', 'TACG')
-                # Reverse
-                fileDict[seqId]["seq"] = fileDict[seqId]["seq"].translate(comp)[::-1]
-                if file_type == "fastq":
-                    fileDict[seqId]["qual"] = fileDict[seqId]["qual"][::-1]
-        else:
-            idNotBlast.append(seqId)
-    for seqId in idNotBlast:
-        fileDict.pop(seqId, None)
-    return fileDict, idSeqRevComp, idNotBlast
-
-
-def write_output_files(newFileDict, idSeqRevComp, idNotBlast, file_type, output_file, output_log):
+                minus.append(len(keptIds))
+            keptIds.append(seqId)
+            keptSeqs.append(seq)
+            keptQuals.append(qual)
+        yield keptIds, keptSeqs, keptQuals, minus
+
+
+def reverse_complement(seqs, quals, minus, file_type):
     """
-    Write the new FASTA or FASTQ file with all the reads in the plus strand 
+    Reverse complement in place the sequences and qualities at the indexes into minus, which are on the minus strand, 
+    and return them like : (seqs, quals). 
+    Only use its arguments so it can be run into a worker process.
+    """
+    for i in minus:
+        # Complement and reverse
+        seqs[i] = seqs[i].translate(_COMP_TABLE)[::-1]
+        if file_type == "fastq":
+            quals[i] = quals[i][::-1]
+    return seqs, quals
+
+
+def write_output_files(batches, idSeqRevComp, idNotBlast, file_type, output_file, output_log):
+    """
+    Write the new FASTA or FASTQ file with all the reads in the plus strand while batches of records are read 
     and the log file with all id of reads reverse complemented and where strand was not find by blast.
     """
-    for seqId in newFileDict.keys():
-        if file_type=="fasta":
-            print(">"+seqId, file=output_file)
-            print(newFileDict[seqId]["seq"], file=output_file)
-        elif file_type=="fastq":
-            print("@"+seqId, file=output_file)
-            print(newFileDict[seqId]["seq"], file=output_file)
-            print("+", file=output_file)
-            print(newFileDict[seqId]["qual"], file=output_file)
+    if file_type=="fasta":
+        write_fasta(batches, output_file)
+    elif file_type=="fastq":
+        write_fastq(batches, output_file)
     # Log file
     print("*---------- Sequences reverse complemented ("+str(len(idSeqRevComp))+") : ", file=output_log)
-    print("\n".join(idSeqRevComp), file=output_log)
+    print("\n".join(seqId.decode() for seqId in idSeqRevComp), file=output_log)
     print("\n*---------- Sequences where strand was not find ("+str(len(idNotBlast))+") : ", file=output_log)
-    print("\n".join(idNotBlast), file=output_log)
+    print("\n".join(seqId.decode() for seqId in idNotBlast), file=output_log)
 
 
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="Script to reverse complement sequences which are on the minus strand")
-    parser.add_argument('--input_file', '-f', required=True,help="Input file with all reads",type=argparse.FileType('r'))
+    parser.add_argument('--input_file', '-f', required=True,help="Input file with all reads",type=argparse.FileType('rb'))
     parser.add_argument('--file_type', '-t', required=True,help="Format of the input file : fasta or fastq",type=str)
-    parser.add_argument('--blast_file', '-b', required=True,help="Output file of blast formated with columns 'qseqid sstrand'",type=argparse.FileType('r'))
-    parser.add_argument('--output_file', '-o', required=True,help="Output file with all sequences on plus strand",type=argparse.FileType('w'))
+    parser.add_argument('--blast_file', '-b', required=True,help="Output file of blast formated with columns 'qseqid sstrand'",type=argparse.FileType('rb'))
+    parser.add_argument('--output_file', '-o', required=True,help="Output file with all sequences on plus strand",type=argparse.FileType('wb'))
     parser.add_argument('--output_log', '-l', required=True,help="Output log",type=argparse.FileType('w'))
+    parser.add_argument('--threads', '-p', required=False,default=1,help="Number of worker processes used to transform sequences, default 1",type=int)
     args = parser.parse_args()
     
+    # Only the blast file is kept in memory, sequences are streamed from the input file to the output file
+    blast_dict = parse_blast_file(args.blast_file)
     if args.file_type == "fasta" :
-        file_dict = parse_fasta(args.input_file)
+        records = iter_fasta(args.input_file)
     elif args.file_type == "fastq" : 
-        file_dict = parse_fastq(args.input_file)
-    blast_dict = parse_blast_file(args.blast_file)
-    new_file_dict, id_seq_rev_comp, id_seq_not_blast = reverse_complement(file_dict, blast_dict, args.file_type)
-    write_output_files(new_file_dict, id_seq_rev_comp, id_seq_not_blast, args.file_type, args.output_file, args.output_log)
-   
\ No newline at end of file
+        records = iter_fastq(args.input_file)
+    id_seq_rev_comp, id_seq_not_blast = list(), list()
+    batches = select_strand(iter_batches(records), blast_dict, id_seq_rev_comp, id_seq_not_blast)
+    batches = map_batches(partial(reverse_complement, file_type=args.file_type), batches, args.threads)
+    write_output_files(batches, id_seq_rev_comp, id_seq_not_blast, args.file_type, args.output_file, args.output_log)
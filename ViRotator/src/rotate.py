@@ -2,118 +2,104 @@
 
 
 import os, argparse
+from functools import partial
+from viro_io import iter_fasta, iter_fastq, iter_batches, map_batches, write_fasta, write_fastq
 
 """
 USAGE
-    ./rotate.py [-h] -f <input_file> -t <file_type> -b <blast_file> -o <output_file> -l <output_log>
+    ./rotate.py [-h] -f <input_file> -t <file_type> -b <blast_file> -o <output_file> -l <output_log> [-p <threads>]
 DESCRIPTION
     Script to rotate sequences.
+    Records are streamed, so a duplicated id is written, rotated and logged once per occurrence, in input order.
 PREREQUISITE
     - python3
+    - viro_io.py
     - A Blast file formated like 'qseqid qstart'
 WARNING
     ! This script can be used only with tripled sequences !
 """
 
 
-def parse_fasta(input_file):
-    """
-    Parse input FASTA file and keep it into a dict like : {seqId : {"seq" : }}
-    """
-    fastaDict = dict()
-    seqId = None
-    for line in input_file:
-        if line.startswith(">"):
-            seqId = line.strip().replace(">","").split()[0]
-            fastaDict[seqId] = {}
-            fastaDict[seqId]["seq"] = ""
-        else:
-            fastaDict[seqId]["seq"] += line.strip()
-    return fastaDict
-
-
-def parse_fastq(input_file):
-    """
-    Parse input FASTQ file and keep it into a dict like : {seqId : {"seq" : , "qual" : }}
-    """
-    fastqDict = dict()
-    seqId = None
-    for line in input_file:
-        if line.startswith("@") and "~" not in line: # Rq : some quality lines start with @ this is why there is the second part of the if
-            seqId = line.strip().replace("@","").split()[0]
-            complementary_lines = []
-            fastqDict[seqId] = {}
-            fastqDict[seqId]["seq"] = ""
-            fastqDict[seqId]["qual"] = ""
-        else:
-            complementary_lines.append(line.strip())
-            if len(complementary_lines)==3:
-                fastqDict[seqId]["seq"] += complementary_lines[0] 
-                fastqDict[seqId]["qual"] += complementary_lines[2]
-    return fastqDict
-
-
 def parse_blast_file(blast_file):
     """
-    Parse input blast file and keep it into a dict like : {seqId : {"pos" : [] }}
+    Parse input blast file and keep it into a dict like : {seqId : (start2, start3)} with the 2nd and 3rd starting position 
+    of the discovered gene in the ordered list, in zero base. The value is () if the gene was find less than three times 
+    and sequences where the gene was find more than three times are not kept.
     """
-    blastDict = dict()
+    posDict = dict()
     for line in blast_file:
-        line = line.strip().split("\t")
+        line = line.strip().split(b"\t")
         seqId = line[0]
         pos = int(line[1])
-        if seqId not in blastDict:
-            blastDict[seqId] = dict()
-            blastDict[seqId]["pos"] = [pos]
+        if seqId not in posDict:
+            posDict[seqId] = [pos]
         else:
-            blastDict[seqId]["pos"].append(pos)
+            posDict[seqId].append(pos)
+    blastDict = dict()
+    for seqId, pos in posDict.items():
+        if len(pos) == 3:
+            pos.sort()
+            blastDict[seqId] = (pos[1] - 1, pos[2] - 1) # Minus 1 because Blast positions are on one base or Python in zero base
+        elif len(pos) < 3:
+            blastDict[seqId] = ()
     return blastDict
 
 
-def rotate(fileDict, blastDict, file_type):
+def select_positions(batches, blastDict, idNotBlast, idLessBlast):
     """
-    Rotate sequences according on the 2nd and 3rd starting position of the discovered gene in the ordered list.
+    Keep into each batch the sequences where position of gene was find, info into blastDict, and yield them with the indexes of 
+    the sequences to rotate and their positions like : (ids, seqs, quals, indexes, positions) where positions is a list like : 
+    [(start2, start3)], as expected by map_batches. 
+    Keep all id of sequences where position of gene was not find into the list idNotBlast 
+    and all id of sequences where position of gene was find less than three times into the list idLessBlast.
     """
-    idNotBlast = list()
-    idLessBlast = list()
-    for seqId in fileDict:
-        if seqId in blastDict and len(blastDict[seqId]["pos"]) == 3:
-            blastDict[seqId]["pos"].sort()
-            start2 = blastDict[seqId]["pos"][1] - 1 # Minus 1 because Blast positions are on one base or Python in zero base
-            start3 = blastDict[seqId]["pos"][2] - 1
-            fileDict[seqId]["seq"] = fileDict[seqId]["seq"][start2:start3]
-            if file_type == "fastq":
-                fileDict[seqId]["qual"] = fileDict[seqId]["qual"][start2:start3]
-        elif seqId in blastDict and len(blastDict[seqId]["pos"]) < 3:
-            idLessBlast.append(seqId)
-        else:
-            idNotBlast.append(seqId)
-    for seqId in idNotBlast:
-        fileDict.pop(seqId, None)
-    return fileDict, idLessBlast, idNotBlast
+    for ids, seqs, quals in batches:
+        keptIds, keptSeqs, keptQuals, indexes, positions = list(), list(), list(), list(), list()
+        for seqId, seq, qual in zip(ids, seqs, quals):
+            pos = blastDict.get(seqId)
+            if pos is None:
+                idNotBlast.append(seqId)
+                continue
+            if pos:
+                indexes.append(len(keptIds))
+                positions.append(pos)
+            else:
+                idLessBlast.append(seqId)
+            keptIds.append(seqId)
+            keptSeqs.append(seq)
+            keptQuals.append(qual)
+        yield keptIds, keptSeqs, keptQuals, indexes, positions
+
+
+def rotate(seqs, quals, indexes, positions, file_type, view=True):
+    """
+    Rotate in place the sequences and qualities at indexes between their two positions and return them like : (seqs, quals). 
+    Sequences are sliced through a memoryview so they're only copied when written, unless view is False 
+    because memoryviews can't be sent back from a worker process. Only use its arguments so it can be run into a worker process.
+    """
+    for i, (start2, start3) in zip(indexes, positions):
+        seqs[i] = memoryview(seqs[i])[start2:start3] if view else seqs[i][start2:start3]
+        if file_type == "fastq":
+            quals[i] = memoryview(quals[i])[start2:start3] if view else quals[i][start2:start3]
+    return seqs, quals
 
 
-def write_output_files(newFileDict, idNotBlast, idLessBlast, file_type, output_file, output_log):
+def write_output_files(batches, idNotBlast, idLessBlast, file_type, output_file, output_log):
     """
-    Write the new FASTA or FASTQ file with all the sequences rotate 
+    Write the new FASTA or FASTQ file with all the sequences rotate while batches of records are read 
     and the log file with all id of sequences where position of gene was not find.
     """
-    for seqId in newFileDict.keys():
-        if file_type=="fasta":
-            print(">"+seqId, file=output_file)
-            print(newFileDict[seqId]["seq"], file=output_file)
-        elif file_type=="fastq":
-            print("@"+seqId, file=output_file)
-            print(newFileDict[seqId]["seq"], file=output_file)
-            print("+", file=output_file)
-            print(newFileDict[seqId]["qual"], file=output_file)
+    if file_type=="fasta":
+        write_fasta(batches, output_file)
+    elif file_type=="fastq":
+        write_fastq(batches, output_file)
     # Log files
     outputPath, outputName = os.path.split(output_log.name)
     outputName = os.path.splitext(outputName)[0]
     print("\n*---------- Sequences where position of the gene for rotation was not find ("+str(len(idNotBlast))+") : ", file=output_log)
-    print("\n".join(idNotBlast), file=output_log)
+    print("\n".join(seqId.decode() for seqId in idNotBlast), file=output_log)
     print("\n*---------- Sequences where position of the gene for rotation was find but less than three times ("+str(len(idLessBlast))+") : ", file=output_log)
-    print("\n".join(idLessBlast), file=output_log)
+    print("\n".join(seqId.decode() for seqId in idLessBlast), file=output_log)
     with open(outputPath+"/rejected.count.txt", "a") as output_count:
         print(outputName+"\t"+str(len(idNotBlast))+"\t"+str(len(idLessBlast)), file=output_count)
 
@@ -121,17 +107,21 @@ def write_output_files(newFileDict, idNotBlast, idLessBlast, file_type, output_f
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="Script to rotate sequences")
-    parser.add_argument('--input_file', '-f', required=True,help="Input file with all reads tripled",type=argparse.FileType('r'))
+    parser.add_argument('--input_file', '-f', required=True,help="Input file with all reads tripled",type=argparse.FileType('rb'))
     parser.add_argument('--file_type', '-t', required=True,help="Format of the input file : fasta or fastq",type=str)
-    parser.add_argument('--blast_file', '-b', required=True,help="Output file of Blast formated with columns 'qseqid qstart'",type=argparse.FileType('r'))
-    parser.add_argument('--output_file', '-o', required=True,help="Output file with all reads rotated",type=argparse.FileType('w'))
+    parser.add_argument('--blast_file', '-b', required=True,help="Output file of Blast formated with columns 'qseqid qstart'",type=argparse.FileType('rb'))
+    parser.add_argument('--output_file', '-o', required=True,help="Output file with all reads rotated",type=argparse.FileType('wb'))
     parser.add_argument('--output_log', '-l', required=True,help="Output log",type=argparse.FileType('a'))
+    parser.add_argument('--threads', '-p', required=False,default=1,help="Number of worker processes used to transform sequences, default 1",type=int)
     args = parser.parse_args()
     
+    # Only the blast file is kept in memory, sequences are streamed from the input file to the output file
+    blast_dict = parse_blast_file(args.blast_file)
     if args.file_type == "fasta" :
-        file_dict = parse_fasta(args.input_file)
+        records = iter_fasta(args.input_file)
     elif args.file_type == "fastq" : 
-        file_dict = parse_fastq(args.input_file)
-    blast_dict = parse_blast_file(args.blast_file)
-    new_file_dict, id_seq_less_blast, id_seq_not_blast = rotate(file_dict, blast_dict, args.file_type)
-    write_output_files(new_file_dict, id_seq_not_blast, id_seq_less_blast, args.file_type, args.output_file, args.output_log)
+        records = iter_fastq(args.input_file)
+    id_seq_not_blast, id_seq_less_blast = list(), list()
+    batches = select_positions(iter_batches(records), blast_dict, id_seq_not_blast, id_seq_less_blast)
+    batches = map_batches(partial(rotate, file_type=args.file_type, view=args.threads <= 1), batches, args.threads)
+    write_output_files(batches, id_seq_not_blast, id_seq_less_blast, args.file_type, args.output_file, args.output_log)
@@ -0,0 +1,211 @@
+"""
+DESCRIPTION
+    Functions shared by rev_comp.py, triple.py and rotate.py to read, process and write FASTA and FASTQ files as streams of batches.
+PREREQUISITE
+    - python3
+NOTE
+    The module is fully annotated so it can be compiled into a C extension with 'mypyc viro_io.py', 
+    the scripts then import the compiled module instead of this file without any change.
+"""
+
+
+import mmap, os
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from typing import IO, Any, Callable, Deque, Iterable, Iterator, List, Optional, Tuple
+
+
+# A record like : (seqId, seq, qual) and a batch of records like : (ids, seqs, quals), 
+# sequences and qualities can be any bytes-like object once transformed
+Record = Tuple[bytes, bytes, Optional[bytes]]
+Batch = Tuple[List[bytes], List[Any], List[Any]]
+
+
+# Number of records processed together in a batch
+BATCH_SIZE = 10000
+
+# Size reached by the output buffer before it's written into the output file
+BUFFER_SIZE = 1 << 20
+
+
+def iter_fasta(input_file: IO[bytes]) -> Iterator[Record]:
+    """
+    Read input FASTA file opened in binary mode record by record and yield tuples like : (seqId, seq, None). 
+    The file is memory-mapped so each record is found with one search instead of reading the file line by line.
+    """
+    try:
+        data = mmap.mmap(input_file.fileno(), 0, access=mmap.ACCESS_READ)
+    except (OSError, ValueError): # ValueError for an empty file, OSError for a pipe or tty which can't be memory-mapped
+        yield from iter_fasta_lines(input_file)
+        return
+    with data:
+        size = len(data)
+        start = 0 if data[:1] == b">" else data.find(b"\n>") + 1
+        if start == 0 and data[:1] != b">": # No header into the file
+            return
+        while start < size:
+            end = data.find(b"\n>", start)
+            end = size if end < 0 else end + 1
+            headerEnd = data.find(b"\n", start, end)
+            if headerEnd < 0: # Last header without sequence nor new line
+                headerEnd = end
+            seqId = data[start + 1:headerEnd].split(None, 1)[0]
+            yield seqId, data[headerEnd + 1:end].translate(None, b" \t\r\n"), None
+            start = end
+
+
+def iter_fasta_lines(input_file: IO[bytes]) -> Iterator[Record]:
+    """
+    Read input FASTA file opened in binary mode line by line and yield tuples like : (seqId, seq, None)
+    """
+    seqId: Optional[bytes] = None
+    seqLines: List[bytes] = []
+    for line in input_file:
+        if line.startswith(b">"):
+            if seqId is not None:
+                yield seqId, b"".join(seqLines), None
+            seqId = line[1:].split(None, 1)[0]
+            seqLines = []
+        else:
+            seqLines.append(line.strip())
+    if seqId is not None:
+        yield seqId, b"".join(seqLines), None
+
+
+def iter_fastq(input_file: IO[bytes]) -> Iterator[Record]:
+    """
+    Read input FASTQ file opened in binary mode record by record and yield tuples like : (seqId, seq, qual). 
+    Records are read four lines at a time : header, sequence, '+' and quality. Blank lines between records are skipped 
+    and a ValueError is raised if a record is malformed or incomplete.
+    """
+    lines = iter(input_file)
+    for header in lines:
+        if not header.strip(): # Blank line between records
+            continue
+        fields = header[1:].split(None, 1)
+        if not header.startswith(b"@") or not fields:
+            raise ValueError("FASTQ header expected, found : "+header.decode(errors="replace").rstrip())
+        seqId = fields[0]
+        seq = next(lines, None)
+        plus = next(lines, None)
+        qual = next(lines, None)
+        if seq is None or plus is None or qual is None:
+            raise ValueError("FASTQ record "+seqId.decode(errors="replace")+" is incomplete at the end of the file")
+        if not plus.startswith(b"+"):
+            raise ValueError("FASTQ record "+seqId.decode(errors="replace")+" has no '+' line after its sequence")
+        yield seqId, seq.strip(), qual.strip()
+
+
+def iter_batches(records: Iterable[Record], batch_size: int = BATCH_SIZE) -> Iterator[Batch]:
+    """
+    Group records into batches of index-aligned lists like : (ids, seqs, quals)
+    """
+    ids: List[bytes] = list()
+    seqs: List[Any] = list()
+    quals: List[Any] = list()
+    for seqId, seq, qual in records:
+        ids.append(seqId)
+        seqs.append(seq)
+        quals.append(qual)
+        if len(ids) == batch_size:
+            yield ids, seqs, quals
+            ids, seqs, quals = list(), list(), list()
+    if ids:
+        yield ids, seqs, quals
+
+
+def split_work(batch: Tuple[Any, ...]) -> Tuple[Any, ...]:
+    """
+    Return the arguments sent to a worker process for a batch like : (ids, seqs, quals, indexes, *args), 
+    that is only the sequences and qualities at indexes, their new indexes into these lists and args
+    """
+    seqs, quals, indexes = batch[1], batch[2], batch[3]
+    return ([seqs[i] for i in indexes], [quals[i] for i in indexes], range(len(indexes))) + tuple(batch[4:])
+
+
+def merge_work(batch: Tuple[Any, ...], result: Tuple[List[Any], List[Any]]) -> Batch:
+    """
+    Put the sequences and qualities returned by the function of map_batches back at their indexes into the batch 
+    and return it like : (ids, seqs, quals)
+    """
+    ids, seqs, quals, indexes = batch[0], batch[1], batch[2], batch[3]
+    workSeqs, workQuals = result
+    for i, seq, qual in zip(indexes, workSeqs, workQuals):
+        seqs[i] = seq
+        quals[i] = qual
+    return ids, seqs, quals
+
+
+def map_batches(function: Callable[..., Tuple[List[Any], List[Any]]], batches: Iterable[Tuple[Any, ...]], threads: int) -> Iterator[Batch]:
+    """
+    Apply function on the records which need work into each batch like : (ids, seqs, quals, indexes, *args) and yield the batches 
+    like : (ids, seqs, quals) in the same order. function is called like function(seqs, quals, indexes, *args), transforms 
+    the sequences and qualities at indexes in place and return (seqs, quals). If threads is one, each batch is transformed in place. 
+    Otherwise, only the records at indexes are sent to worker processes and put back into their batch, 
+    keeping at most two batches per worker in flight so the input file is still read as a stream.
+    """
+    if threads <= 1:
+        for batch in batches:
+            function(*batch[1:])
+            yield batch[0], batch[1], batch[2]
+        return
+    with ProcessPoolExecutor(max_workers=threads) as executor:
+        pending: Deque[Any] = deque()
+        for batch in batches:
+            pending.append((batch, executor.submit(function, *split_work(batch))))
+            if len(pending) >= 2*threads:
+                batch, future = pending.popleft()
+                yield merge_work(batch, future.result())
+        while pending:
+            batch, future = pending.popleft()
+            yield merge_work(batch, future.result())
+
+
+def write_buffer(buffer: bytearray, output_file: IO[bytes]) -> None:
+    """
+    Write the whole buffer straight to the file descriptor of output_file, without the Python buffered writer, and empty it
+    """
+    fd = output_file.fileno()
+    with memoryview(buffer) as view:
+        written = 0
+        while written < len(view): # os.write can write only a part of the buffer
+            written += os.write(fd, view[written:])
+    buffer.clear()
+
+
+def write_fasta(batches: Iterable[Batch], output_file: IO[bytes]) -> None:
+    """
+    Write batches of records into a FASTA file opened in binary mode, through a buffer written each time it reaches BUFFER_SIZE
+    """
+    output_file.flush()
+    buffer = bytearray()
+    for ids, seqs, quals in batches:
+        for seqId, seq in zip(ids, seqs):
+            buffer += b">"
+            buffer += seqId
+            buffer += b"\n"
+            buffer += seq
+            buffer += b"\n"
+            if len(buffer) >= BUFFER_SIZE:
+                write_buffer(buffer, output_file)
+    write_buffer(buffer, output_file)
+
+
+def write_fastq(batches: Iterable[Batch], output_file: IO[bytes]) -> None:
+    """
+    Write batches of records into a FASTQ file opened in binary mode, through a buffer written each time it reaches BUFFER_SIZE
+    """
+    output_file.flush()
+    buffer = bytearray()
+    for ids, seqs, quals in batches:
+        for seqId, seq, qual in zip(ids, seqs, quals):
+            buffer += b"@"
+            buffer += seqId
+            buffer += b"\n"
+            buffer += seq
+            buffer += b"\n+\n"
+            buffer += qual
+            buffer += b"\n"
+            if len(buffer) >= BUFFER_SIZE:
+                write_buffer(buffer, output_file)
+    write_buffer(buffer, output_file)